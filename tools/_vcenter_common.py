@@ -0,0 +1,841 @@
+"""
+Connection, VM lookup, task, output and run helpers shared by the VM
+configuration tools.
+
+add_ptp_to_vm.py and add_vmotion_notification_to_vm.py both import this
+module. It runs as plain Python, and can be compiled with mypyc for lower
+per-call overhead in the lookup and task wait loops (see README); Python
+loads the compiled extension instead of this file when it is present.
+"""
+
+import argparse
+import atexit
+import functools
+import getpass
+import json
+import os
+import queue
+import ssl
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional, TextIO, Tuple
+
+# The vSphere modules are slow to import, so they are loaded by
+# import_vsphere_modules() on connect instead of at startup
+vim: Any = None
+vmodl: Any = None
+SmartConnect: Any = None
+Disconnect: Any = None
+VCenterRestClient: Any = None
+connect_via_agent: Any = None
+
+
+class OutputPrinter:
+    """
+    Prints the output of VMs processed in parallel as one block per VM.
+
+    Lines logged by a worker inside run_buffered() are held back in that
+    thread's buffer until its VM is done. Once start() has been called,
+    every line goes through a single printer thread, which keeps the
+    blocks whole and in order with the lines logged by the main thread.
+    """
+
+    def __init__(self) -> None:
+        self._queue: "queue.Queue[List[Tuple[TextIO, str]]]" = queue.Queue()
+        self._local = threading.local()
+        self._printer_thread: Optional[threading.Thread] = None
+
+    def log(self, message: str, file: Optional[TextIO] = None) -> None:
+        """
+        Print a line, or buffer it while a VM is processed.
+
+        Args:
+            message: Line to print
+            file: Stream to print to (default: sys.stdout)
+        """
+        stream = file or sys.stdout
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is not None:
+            buffer.append((stream, message + '\n'))
+        elif self._printer_thread:
+            self._queue.put([(stream, message + '\n')])
+        else:
+            print(message, file=stream)
+
+    def run_buffered(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Call a function, printing everything it logs as one block afterwards.
+
+        Args:
+            func: Function to call
+            *args: Arguments for func
+
+        Returns:
+            Result of func
+        """
+        lines: List[Tuple[TextIO, str]] = []
+        self._local.buffer = lines
+        try:
+            return func(*args)
+        finally:
+            self._local.buffer = None
+            if self._printer_thread:
+                self._queue.put(lines)
+            else:
+                self._write(lines)
+
+    def start(self) -> None:
+        """Start the printer thread."""
+        if not self._printer_thread:
+            self._printer_thread = threading.Thread(target=self._print, daemon=True)
+            self._printer_thread.start()
+
+    def flush(self) -> None:
+        """Wait until the printer thread has written all queued output."""
+        if self._printer_thread:
+            self._queue.join()
+
+    def _print(self) -> None:
+        """Write queued output blocks; runs in the printer thread."""
+        while True:
+            self._write(self._queue.get())
+            self._queue.task_done()
+
+    @staticmethod
+    def _write(lines: List[Tuple[TextIO, str]]) -> None:
+        """Write a block of output lines."""
+        for stream, text in lines:
+            stream.write(text)
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
+# Output of the current run, shared by the tools and this module
+output = OutputPrinter()
+
+
+def log(message: str, file: Optional[TextIO] = None) -> None:
+    """
+    Print a line through the shared OutputPrinter.
+
+    Args:
+        message: Line to print
+        file: Stream to print to (default: sys.stdout)
+    """
+    output.log(message, file)
+
+
+def import_vsphere_modules() -> None:
+    """Import pyVmomi and the optional REST client and agent on first use."""
+    global vim, vmodl, SmartConnect, Disconnect, VCenterRestClient, connect_via_agent
+
+    if vim is not None:
+        return
+
+    import pyVim.connect
+    import pyVmomi
+
+    SmartConnect = pyVim.connect.SmartConnect
+    Disconnect = pyVim.connect.Disconnect
+    vim = pyVmomi.vim
+    vmodl = pyVmomi.vmodl
+
+    try:
+        import vcenter_rest
+        VCenterRestClient = vcenter_rest.VCenterRestClient
+    except ImportError:
+        VCenterRestClient = None
+
+    # vcenter_agent.py needs Unix sockets; without them (AttributeError from
+    # socketserver) there is never an agent session to reuse
+    try:
+        import vcenter_agent
+        connect_via_agent = vcenter_agent.connect_via_agent
+    except (ImportError, AttributeError):
+        connect_via_agent = None
+
+
+@functools.lru_cache(maxsize=None)
+def create_ssl_context(no_ssl_verify: bool) -> ssl.SSLContext:
+    """
+    Get the SSL context for vCenter connections.
+
+    The context is created once per setting and shared by every connection
+    of the process, including reconnects, so the CA bundle is loaded and
+    the cipher configuration is set up only once.
+
+    Args:
+        no_ssl_verify: Disable SSL certificate verification
+
+    Returns:
+        SSLContext object
+    """
+    if no_ssl_verify:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    else:
+        context = ssl.create_default_context()
+    context.options |= ssl.OP_NO_COMPRESSION
+    return context
+
+
+def connect(host: str, user: str, password: Optional[str] = None, port: int = 443,
+            no_ssl_verify: bool = True, use_agent: bool = True,
+            pool_size: int = 5, cleanup_on_exit: bool = True) -> Tuple[Any, Optional[str]]:
+    """
+    Connect to vCenter, reusing the session of a running agent when possible.
+
+    The password is only needed, and only prompted for (see get_password()),
+    when there is no agent session to reuse. A session of its own is
+    disconnected on exit; an agent session belongs to the agent and is left
+    open.
+
+    Args:
+        host: vCenter hostname or IP
+        user: vCenter username
+        password: vCenter password given on the command line, if any
+        port: vCenter port (default 443)
+        no_ssl_verify: Disable SSL certificate verification (default True)
+        use_agent: Reuse the session of a running vcenter_agent.py if
+            available (default True)
+        pool_size: Number of idle HTTPS connections to vCenter kept open
+            for reuse (default 5)
+        cleanup_on_exit: Disconnect a session of its own on exit (default
+            True); callers passing False disconnect it themselves
+
+    Returns:
+        Tuple of the ServiceInstance object and the password used to log
+        in, or None as the password if the session was borrowed from the
+        agent
+
+    Raises:
+        Exception: If the login fails
+    """
+    import_vsphere_modules()
+    context = create_ssl_context(no_ssl_verify)
+
+    si = None
+    if use_agent and connect_via_agent:
+        si = connect_via_agent(host, user, port, context)
+    if si is None:
+        password = get_password(user, password)
+        si = SmartConnect(
+            host=host,
+            user=user,
+            pwd=password,
+            port=port,
+            sslContext=context
+        )
+        if cleanup_on_exit:
+            atexit.register(Disconnect, si)
+    else:
+        password = None
+
+    # Keep an open connection for every concurrent request, so parallel
+    # workers do not reconnect and redo the TLS handshake
+    si._stub.poolSize = pool_size
+
+    return si, password
+
+
+def create_vm_view(content: Any, cleanup_on_exit: bool = True) -> Any:
+    """
+    Create a ContainerView of all VMs, destroyed on exit.
+
+    Args:
+        content: ServiceInstance content
+        cleanup_on_exit: Destroy the view on exit (default True)
+
+    Returns:
+        ContainerView object
+    """
+    vm_view = content.viewManager.CreateContainerView(
+        content.rootFolder, [vim.VirtualMachine], True
+    )
+    if cleanup_on_exit:
+        atexit.register(vm_view.Destroy)
+    return vm_view
+
+
+def create_rest_client(host: str, user: str, password: str, port: int = 443,
+                       no_ssl_verify: bool = True, cleanup_on_exit: bool = True) -> Any:
+    """
+    Log in to the REST API for VM lookups, logged out on exit.
+
+    Args:
+        host: vCenter hostname or IP
+        user: vCenter username
+        password: vCenter password
+        port: vCenter port (default 443)
+        no_ssl_verify: Disable SSL certificate verification (default True)
+        cleanup_on_exit: Log out on exit (default True)
+
+    Returns:
+        Logged-in VCenterRestClient, or None if the REST API is unavailable
+    """
+    if not VCenterRestClient:
+        return None
+
+    try:
+        rest_client = VCenterRestClient(host, user, password, port, no_ssl_verify)
+        rest_client.login()
+    except Exception as e:
+        print(f"  REST API unavailable, using SOAP for lookups: {str(e)}")
+        return None
+
+    if cleanup_on_exit:
+        atexit.register(rest_client.logout)
+    return rest_client
+
+
+def get_vms_by_names(content: Any, vm_view: Any, vm_names: Iterable[str],
+                     rest_client: Any = None) -> Dict[str, Any]:
+    """
+    Find several VMs by name.
+
+    Plain names are resolved with one REST API call when a client is given,
+    otherwise with a single PropertyCollector query over all VMs. Inventory
+    paths are resolved one by one through the SearchIndex.
+
+    Args:
+        content: ServiceInstance content
+        vm_view: ContainerView of all VirtualMachine objects
+        vm_names: Iterable of VM names or inventory paths to find
+        rest_client: Optional logged-in VCenterRestClient
+
+    Returns:
+        Dictionary mapping each found VM name to its VirtualMachine object
+    """
+    names = list(vm_names)
+    vms: Dict[str, Any] = {}
+
+    if rest_client:
+        plain_names = [vm_name for vm_name in names if '/' not in vm_name]
+        try:
+            if plain_names:
+                for vm_name, vm_id in rest_client.list_vms(plain_names).items():
+                    vms[vm_name] = vim.VirtualMachine(vm_id, vm_view._stub)
+            # The REST lookup covers the whole inventory, so names it did
+            # not return do not exist
+            names = [vm_name for vm_name in names if '/' in vm_name]
+        except Exception as e:
+            print(f"  REST lookup failed, falling back to SOAP: {str(e)}")
+
+    # A plain name may be in any folder of any datacenter, which the
+    # SearchIndex cannot search in one call; one scan covers them all
+    plain_names = [vm_name for vm_name in names if '/' not in vm_name]
+    if plain_names:
+        vms.update(get_vms_by_names_from_view(content, vm_view, plain_names))
+
+    for vm_name in names:
+        if '/' in vm_name:
+            vm = content.searchIndex.FindByInventoryPath(vm_name)
+            if isinstance(vm, vim.VirtualMachine):
+                vms[vm_name] = vm
+
+    return vms
+
+
+def get_vms_by_names_from_view(content: Any, vm_view: Any,
+                               vm_names: Iterable[str]) -> Dict[str, Any]:
+    """
+    Find several VMs by name with a single PropertyCollector query.
+
+    Args:
+        content: ServiceInstance content
+        vm_view: ContainerView of all VirtualMachine objects
+        vm_names: Iterable of VM names to find
+
+    Returns:
+        Dictionary mapping each found VM name to its VirtualMachine object
+    """
+    wanted = set(vm_names)
+
+    traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+        name='v', type=vim.view.ContainerView, path='view', skip=False
+    )
+    object_spec = vmodl.query.PropertyCollector.ObjectSpec(
+        obj=vm_view, skip=True, selectSet=[traversal_spec]
+    )
+    property_spec = vmodl.query.PropertyCollector.PropertySpec(
+        type=vim.VirtualMachine, pathSet=['name']
+    )
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=[object_spec], propSet=[property_spec]
+    )
+
+    vms: Dict[str, Any] = {}
+    for obj_content in retrieve_properties(content, filter_spec):
+        for prop in obj_content.propSet:
+            if prop.name == 'name' and prop.val in wanted:
+                vms[prop.val] = obj_content.obj
+
+    return vms
+
+
+def collect_vm_props(content: Any, vms: Iterable[Any],
+                     path_set: Iterable[str]) -> Dict[Any, SimpleNamespace]:
+    """
+    Fetch selected properties of several VMs with a single PropertyCollector query.
+
+    Args:
+        content: ServiceInstance content
+        vms: Iterable of VirtualMachine objects
+        path_set: Property paths to retrieve
+
+    Returns:
+        Dictionary mapping each VirtualMachine object to a SimpleNamespace
+        holding the VM ('vm') and one attribute per property path, named
+        after the last path component (e.g. 'powerState', 'device')
+    """
+    object_specs = [
+        vmodl.query.PropertyCollector.ObjectSpec(obj=vm, skip=False) for vm in vms
+    ]
+    if not object_specs:
+        return {}
+
+    paths = list(path_set)
+    property_spec = vmodl.query.PropertyCollector.PropertySpec(
+        type=vim.VirtualMachine, pathSet=paths
+    )
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+        objectSet=object_specs, propSet=[property_spec]
+    )
+
+    vm_props: Dict[Any, SimpleNamespace] = {}
+    for obj_content in retrieve_properties(content, filter_spec):
+        props = SimpleNamespace(vm=obj_content.obj)
+        for path in paths:
+            setattr(props, path.rsplit('.', 1)[-1], None)
+        for prop in obj_content.propSet:
+            setattr(props, prop.name.rsplit('.', 1)[-1], prop.val)
+        vm_props[obj_content.obj] = props
+
+    return vm_props
+
+
+def retrieve_properties(content: Any, filter_spec: Any) -> List[Any]:
+    """
+    Run a PropertyCollector query, following continuation tokens.
+
+    Args:
+        content: ServiceInstance content
+        filter_spec: PropertyCollector FilterSpec
+
+    Returns:
+        List of ObjectContent results
+    """
+    collector = content.propertyCollector
+    options = vmodl.query.PropertyCollector.RetrieveOptions(maxObjects=1000)
+
+    objects: List[Any] = []
+    result = collector.RetrievePropertiesEx([filter_spec], options)
+    while result:
+        objects.extend(result.objects)
+        if not result.token:
+            break
+        result = collector.ContinueRetrievePropertiesEx(result.token)
+
+    return objects
+
+
+def wait_for_task(content: Any, task: Any, timeout: int = 300) -> bool:
+    """
+    Wait for a vCenter task to complete.
+
+    Blocks in PropertyCollector.WaitForUpdatesEx until vCenter reports a
+    change to the task state instead of polling it. Failures are logged to
+    stderr through log().
+
+    Args:
+        content: ServiceInstance content
+        task: Task object
+        timeout: Maximum wait time in seconds
+
+    Returns:
+        True if successful, False otherwise
+    """
+    # A dedicated collector keeps the update versions of this wait
+    # independent from any other filters on the session collector
+    collector = content.propertyCollector.CreatePropertyCollector()
+
+    try:
+        object_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=task, skip=False)
+        property_spec = vmodl.query.PropertyCollector.PropertySpec(
+            type=vim.Task, pathSet=['info.state', 'info.error']
+        )
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[object_spec], propSet=[property_spec]
+        )
+        collector.CreateFilter(filter_spec, partialUpdates=True)
+
+        deadline = time.time() + timeout
+        version = ''
+        state: Any = None
+        error: Any = None
+
+        while state not in [vim.TaskInfo.State.success, vim.TaskInfo.State.error]:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                log(f"Error: Task timed out after {timeout} seconds", file=sys.stderr)
+                return False
+
+            options = vmodl.query.PropertyCollector.WaitOptions(
+                maxWaitSeconds=max(1, int(remaining))
+            )
+            update = collector.WaitForUpdatesEx(version, options)
+            if update is None:
+                continue
+
+            version = update.version
+            for filter_update in update.filterSet:
+                for object_update in filter_update.objectSet:
+                    for change in object_update.changeSet:
+                        if change.name == 'info.state':
+                            state = change.val
+                        elif change.name == 'info.error':
+                            error = change.val
+    finally:
+        collector.Destroy()
+
+    if state == vim.TaskInfo.State.success:
+        return True
+
+    log(f"Error: Task failed with error: {getattr(error, 'msg', error)}", file=sys.stderr)
+    return False
+
+
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    Add the connection, VM selection and run options shared by the tools.
+
+    Args:
+        parser: ArgumentParser to add the options to
+    """
+    parser.add_argument(
+        '-s', '--server',
+        required=True,
+        help='vCenter server hostname or IP address'
+    )
+    parser.add_argument(
+        '-u', '--user',
+        required=True,
+        help='vCenter username'
+    )
+    parser.add_argument(
+        '-w', '--password',
+        help='vCenter password (if not provided, will prompt or use VCENTER_PASSWORD env var)'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=443,
+        help='vCenter server port (default: 443)'
+    )
+    parser.add_argument(
+        '--no-ssl-verify',
+        action='store_true',
+        default=True,
+        help='Disable SSL certificate verification (default: enabled for compatibility)'
+    )
+    parser.add_argument(
+        '--no-agent',
+        action='store_true',
+        help='Log in directly instead of reusing the session of a running vcenter_agent.py'
+    )
+    parser.add_argument(
+        '-v', '--vms',
+        required=True,
+        help='Comma-separated list of VM names or inventory paths (e.g. dc1/vm/folder/vm1)'
+    )
+    parser.add_argument(
+        '--no-confirm',
+        action='store_true',
+        help='Skip confirmation prompt before processing VMs '
+             '(implied when stdin is not a terminal)'
+    )
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Show which VMs would be processed without making changes'
+    )
+    parser.add_argument(
+        '--max-concurrency',
+        type=int,
+        default=16,
+        help='Maximum number of VMs processed in parallel (default: 16)'
+    )
+    parser.add_argument(
+        '--output',
+        choices=['text', 'json'],
+        default='text',
+        help='Summary format; with json, progress goes to stderr and stdout '
+             'only carries the JSON summary (default: text)'
+    )
+
+
+def check_common_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """
+    Validate the options added by add_common_arguments().
+
+    Args:
+        parser: ArgumentParser that parsed the arguments
+        args: Parsed command line arguments
+    """
+    if args.max_concurrency < 1:
+        parser.error('--max-concurrency must be at least 1')
+
+
+def get_password(user: str, password: Optional[str] = None) -> str:
+    """
+    Get the vCenter password.
+
+    Args:
+        user: vCenter username, shown in the prompt
+        password: Password given on the command line, if any
+
+    Returns:
+        The given password, else VCENTER_PASSWORD, else a prompted password
+    """
+    if password:
+        return password
+    return os.environ.get('VCENTER_PASSWORD') or getpass.getpass(f"Enter password for {user}: ")
+
+
+def parse_vm_names(vms: str) -> List[str]:
+    """
+    Parse a comma-separated list of VM names.
+
+    Empty entries and duplicates are dropped, so each VM is looked up and
+    processed only once.
+
+    Args:
+        vms: Comma-separated list of VM names or inventory paths
+
+    Returns:
+        List of VM names in their original order
+    """
+    return list(dict.fromkeys(
+        name for name in (name.strip() for name in vms.split(',')) if name
+    ))
+
+
+class BatchRun:
+    """
+    Steps shared by the tools for processing a list of VMs.
+
+    The tools connect and look up their VMs, then hand each VM to their own
+    per-VM function through process(); a BatchRun collects the outcome of
+    every VM and prints the summary.
+    """
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        """
+        Initialize the run.
+
+        With JSON output, sys.stdout is pointed at stderr for the rest of the
+        run, so that progress messages do not mix with the summary. The
+        summary is written on every exit through exit(), including early
+        ones.
+
+        Args:
+            args: Parsed command line arguments (see add_common_arguments())
+        """
+        self.args = args
+        self.results: Dict[str, List[str]] = {
+            'success': [],
+            'failed': [],
+            'skipped': [],
+            'not_found': []
+        }
+        self.summary_stream: TextIO = sys.stdout
+        if args.output == 'json':
+            sys.stdout = sys.stderr
+
+    def find_vms(self, lookup: Callable[[List[str]], Dict[str, Any]]) -> List[Tuple[str, Any]]:
+        """
+        Look up the VMs given with --vms.
+
+        Names that resolve to a VM already in the list (e.g. a name and the
+        inventory path of the same VM) are reported as duplicates and
+        dropped. Exits if none of them is found.
+
+        Args:
+            lookup: Function mapping a list of VM names to a dictionary of
+                found VM names and VM objects
+
+        Returns:
+            List of (VM name, VM object) tuples in the order given
+        """
+        vm_names = parse_vm_names(self.args.vms)
+
+        print(f"\nLooking up VMs: {', '.join(vm_names)}")
+        found_vms = lookup(vm_names)
+        vms: List[Tuple[str, Any]] = []
+        names_by_moid: Dict[str, str] = {}
+
+        for vm_name in vm_names:
+            vm = found_vms.get(vm_name)
+            if not vm:
+                print(f"  WARNING: VM '{vm_name}' not found")
+                self.results['not_found'].append(vm_name)
+            elif vm._moId in names_by_moid:
+                print(f"  Duplicate: {vm_name} (same VM as {names_by_moid[vm._moId]})")
+            else:
+                names_by_moid[vm._moId] = vm_name
+                vms.append((vm_name, vm))
+                print(f"  Found: {vm_name}")
+
+        if not vms:
+            print("\nNo VMs to process. Exiting.")
+            self.exit(0)
+
+        return vms
+
+    def confirm(self, vms: List[Tuple[str, Any]]) -> None:
+        """
+        List the VMs to process; exits for --dry-run or if the user cancels.
+
+        The confirmation prompt is skipped for --read, --no-confirm and when
+        stdin is not a terminal (e.g. a pipe or a scheduler).
+
+        Args:
+            vms: List of (VM name, VM object) tuples from find_vms()
+        """
+        print(f"\n{'=' * 60}")
+        print(f"Total VMs to process: {len(vms)}")
+        for vm_name, _ in vms:
+            print(f"  - {vm_name}")
+
+        if self.args.dry_run:
+            print(f"\n{'=' * 60}")
+            print("DRY RUN MODE - No changes will be made")
+            print(f"{'=' * 60}")
+            print("\nScript completed (dry run).")
+            self.exit(0)
+
+        if not self.args.no_confirm and not self.args.read and sys.stdin.isatty():
+            print(f"\n{'=' * 60}")
+            confirm = input("Continue with processing? (yes/no): ").strip().lower()
+            if confirm not in ['yes', 'y']:
+                print("Operation cancelled.")
+                self.exit(0)
+
+        print("\n" + "=" * 60)
+        print("Processing VMs...")
+        print("=" * 60)
+
+    def skip(self, vm_name: str, reason: str) -> None:
+        """
+        Record a VM that needs no change.
+
+        Args:
+            vm_name: Name of the VM
+            reason: Why the VM is skipped, completing "VM <name> ..."
+        """
+        log(f"\n  VM {vm_name} {reason}. Skipping.")
+        self.results['skipped'].append(vm_name)
+
+    def process(self, vms: List[Tuple[str, Any]],
+                process_vm: Callable[[Any], Optional[bool]]) -> None:
+        """
+        Process VMs in parallel, bounded by --max-concurrency.
+
+        Each VM's output is printed as one block once it is done.
+
+        Args:
+            vms: List of (VM name, VM properties) tuples; VMs whose
+                properties are None are reported as no longer found
+            process_vm: Function processing one VM given its properties,
+                returning True if successful, False if failed and None if
+                skipped
+        """
+        output.start()
+
+        with ThreadPoolExecutor(max_workers=self.args.max_concurrency) as executor:
+            futures = []
+            for vm_name, vm_props in vms:
+                if vm_props is None:
+                    log(f"\n  ERROR: VM '{vm_name}' no longer found")
+                    self.results['failed'].append(vm_name)
+                    continue
+                futures.append(
+                    (vm_name, executor.submit(output.run_buffered, process_vm, vm_props))
+                )
+
+        for vm_name, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                log(f"Error: Failed to process VM {vm_name}: {str(e)}", file=sys.stderr)
+                result = False
+
+            if result is True:
+                self.results['success'].append(vm_name)
+            elif result is None:
+                self.results['skipped'].append(vm_name)
+            else:
+                self.results['failed'].append(vm_name)
+
+        output.flush()
+
+    def finish(self, skip_reason: Optional[str] = None) -> None:
+        """
+        Print the summary and exit, with status 1 if any VM failed.
+
+        Args:
+            skip_reason: Description of skipped VMs for the text summary;
+                the skipped count is only shown when given
+        """
+        results = self.results
+
+        if self.args.output != 'json':
+            total = len(results['success']) + len(results['skipped']) + len(results['failed'])
+            print("\n" + "=" * 60)
+            print("SUMMARY")
+            print("=" * 60)
+            print(f"Total VMs processed: {total}")
+            print(f"Successful: {len(results['success'])}")
+            if skip_reason is not None:
+                print(f"Skipped: {len(results['skipped'])}")
+            print(f"Failed: {len(results['failed'])}")
+
+            if results['success']:
+                print("\nSuccessful VMs:")
+                for vm_name in results['success']:
+                    print(f"  ✓ {vm_name}")
+
+            if results['skipped']:
+                print(f"\nSkipped VMs ({skip_reason}):")
+                for vm_name in results['skipped']:
+                    print(f"  ⊘ {vm_name}")
+
+            if results['failed']:
+                print("\nFailed VMs:")
+                for vm_name in results['failed']:
+                    print(f"  ✗ {vm_name}")
+
+            print("\nScript completed.")
+
+        self.exit(1 if results['failed'] else 0)
+
+    def exit(self, status: int) -> None:
+        """
+        Exit with the given status, writing the JSON summary first if
+        --output json was given.
+
+        Every exit after the BatchRun is created goes through here, so that
+        callers reading the JSON always get a summary.
+
+        Args:
+            status: Exit status
+        """
+        if self.args.output == 'json':
+            self.summary_stream.write(json.dumps(self.results, separators=(',', ':')) + '\n')
+            self.summary_stream.flush()
+
+        sys.exit(status)
@@ -4,92 +4,196 @@ Script to add PTP device to VMware vSphere VMs.
 Handles VM power states appropriately.
 """
 
-import ssl
-import time
 import argparse
-import sys
-from pyVim.connect import SmartConnect, Disconnect
-from pyVmomi import vim
 import atexit
-import getpass
+import sys
+import _vcenter_common as common
+
+# Bound to pyVmomi's vim namespace by import_vsphere_modules()
+vim = None
+
+# pyVmomi types used to build reconfigure specs, resolved once by
+# import_vsphere_modules() instead of through the vim namespace per VM
+_VirtualDeviceSpec = None
+_PTPClock = None
+_PTPBacking = None
+_ConfigSpec = None
+_AddOp = None
+_RemoveOp = None
+
+# VM properties needed to process a VM, fetched up front in one query
+VM_PROPERTY_PATHS = ['name', 'runtime.powerState', 'config.hardware.device']
+
+
+def import_vsphere_modules():
+    """Import pyVmomi on first use and resolve the spec types."""
+    global vim, _VirtualDeviceSpec, _PTPClock, _PTPBacking, _ConfigSpec, _AddOp, _RemoveOp
+
+    if vim is not None:
+        return
+
+    common.import_vsphere_modules()
+    vim = common.vim
+
+    _VirtualDeviceSpec = vim.vm.device.VirtualDeviceSpec
+    _PTPClock = vim.vm.device.VirtualPrecisionClock
+    _PTPBacking = vim.vm.device.VirtualPrecisionClock.SystemClockBackingInfo
+    _ConfigSpec = vim.vm.ConfigSpec
+    _AddOp = _VirtualDeviceSpec.Operation.add
+    _RemoveOp = _VirtualDeviceSpec.Operation.remove
 
 
 class VCenterManager:
     """Manages vCenter connection and VM operations."""
 
-    def __init__(self, host, user, password, port=443, no_ssl_verify=True):
+    def __init__(self, host, user, password=None, port=443, no_ssl_verify=True, use_agent=True,
+                 pool_size=5, use_rest=True):
         """
         Initialize vCenter connection.
 
         Args:
             host: vCenter hostname or IP
             user: vCenter username
-            password: vCenter password
+            password: vCenter password; prompted for on connect if needed
+                and not given
             port: vCenter port (default 443)
             no_ssl_verify: Disable SSL certificate verification (default True)
+            use_agent: Reuse the session of a running vcenter_agent.py if
+                available (default True)
+            pool_size: Number of idle HTTPS connections to vCenter kept open
+                for reuse (default 5)
+            use_rest: Log in to the REST API for VM lookups (default True)
         """
         self.host = host
         self.user = user
         self.password = password
         self.port = port
         self.no_ssl_verify = no_ssl_verify
+        self.use_agent = use_agent
+        self.pool_size = pool_size
+        self.use_rest = use_rest
+        self.from_agent = False
         self.si = None
+        self.content = None
+        self.rest_client = None
+        self._vm_view = None
 
     def connect(self):
-        """Establish connection to vCenter."""
+        """
+        Establish connection to vCenter.
+
+        Calling it again replaces the current session (e.g. after it
+        expired), releasing the old one first.
+
+        Returns:
+            True if successful, False otherwise
+        """
+        import_vsphere_modules()
+
+        if self.si is None:
+            atexit.register(self.disconnect)
+        else:
+            self.disconnect()
+
         try:
-            # Configure SSL context based on no_ssl_verify setting
-            if self.no_ssl_verify:
-                context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-                context.check_hostname = False
-                context.verify_mode = ssl.CERT_NONE
-            else:
-                context = ssl.create_default_context()
-
-            print(f"Connecting to vCenter: {self.host}...")
-            self.si = SmartConnect(
-                host=self.host,
-                user=self.user,
-                pwd=self.password,
-                port=self.port,
-                sslContext=context
+            self.si, password = common.connect(
+                self.host, self.user, self.password, self.port, self.no_ssl_verify,
+                use_agent=self.use_agent, pool_size=self.pool_size, cleanup_on_exit=False
             )
+            self.from_agent = password is None
+            if self.from_agent:
+                print(f"Reusing vCenter session from local agent: {self.host}")
+            else:
+                self.password = password
 
-            # Register disconnect on exit
-            atexit.register(Disconnect, self.si)
+            # Cache the service content and one VM view for the whole run
+            self.content = self.si.RetrieveContent()
+            self._vm_view = common.create_vm_view(self.content, cleanup_on_exit=False)
             print("Successfully connected to vCenter")
+
+            # Use the REST API for VM lookups when available; skipped for
+            # agent sessions, as it would need a login of its own
+            if self.use_rest and not self.from_agent:
+                self.rest_client = common.create_rest_client(
+                    self.host, self.user, self.password, self.port, self.no_ssl_verify,
+                    cleanup_on_exit=False
+                )
+
             return True
 
         except Exception as e:
             print(f"Error connecting to vCenter: {str(e)}")
             return False
 
+    def disconnect(self):
+        """
+        Release the VM view and REST session, and log out unless the
+        session belongs to the agent.
+
+        Errors are ignored, as the session may already have expired.
+        """
+        if self.rest_client:
+            try:
+                self.rest_client.logout()
+            except Exception:
+                pass
+            self.rest_client = None
+
+        if self._vm_view:
+            try:
+                self._vm_view.Destroy()
+            except Exception:
+                pass
+            self._vm_view = None
+
+        if self.si and not self.from_agent:
+            try:
+                common.Disconnect(self.si)
+            except Exception:
+                pass
+
     def get_vm_by_name(self, vm_name):
         """
         Find VM by name.
 
         Args:
-            vm_name: Name of the VM
+            vm_name: Name or inventory path of the VM
 
         Returns:
             VM object or None if not found
         """
-        content = self.si.RetrieveContent()
-        container = content.viewManager.CreateContainerView(
-            content.rootFolder, [vim.VirtualMachine], True
-        )
+        return self.get_vms_by_names([vm_name]).get(vm_name)
 
-        for vm in container.view:
-            if vm.name == vm_name:
-                container.Destroy()
-                return vm
+    def get_vms_by_names(self, vm_names):
+        """
+        Find several VMs by name (see _vcenter_common.get_vms_by_names()).
+
+        Args:
+            vm_names: Iterable of VM names or inventory paths
+
+        Returns:
+            Dictionary mapping each found VM name to its VM object
+        """
+        return common.get_vms_by_names(self.content, self._vm_view, vm_names, self.rest_client)
+
+    def collect_vm_props(self, vms, path_set=VM_PROPERTY_PATHS):
+        """
+        Fetch selected properties of several VMs with a single PropertyCollector query.
 
-        container.Destroy()
-        return None
+        Args:
+            vms: Iterable of VM objects
+            path_set: Property paths to retrieve
+
+        Returns:
+            Dictionary mapping each VM object to a SimpleNamespace holding the
+            VM object ('vm') and one attribute per property path, named after
+            the last path component (e.g. 'powerState', 'device')
+        """
+        return common.collect_vm_props(self.content, vms, path_set)
 
     def wait_for_task(self, task, timeout=300):
         """
-        Wait for vCenter task to complete.
+        Wait for vCenter task to complete (see _vcenter_common.wait_for_task()).
 
         Args:
             task: Task object
@@ -98,236 +202,264 @@ class VCenterManager:
         Returns:
             True if successful, False otherwise
         """
-        start_time = time.time()
-
-        while task.info.state not in [vim.TaskInfo.State.success, vim.TaskInfo.State.error]:
-            if time.time() - start_time > timeout:
-                print(f"Task timed out after {timeout} seconds")
-                return False
-            time.sleep(1)
+        return common.wait_for_task(self.content, task, timeout)
 
-        if task.info.state == vim.TaskInfo.State.success:
-            return True
-        else:
-            print(f"Task failed: {task.info.error}")
-            return False
-
-    def power_off_vm(self, vm):
+    def power_off_vm(self, vm_props):
         """
         Power off a VM.
 
         Args:
-            vm: VM object
+            vm_props: VM properties from collect_vm_props()
 
         Returns:
             True if successful, False otherwise
         """
         try:
-            print(f"  Powering off VM: {vm.name}...")
-            task = vm.PowerOffVM_Task()
+            common.log(f"  Powering off VM: {vm_props.name}...")
+            task = vm_props.vm.PowerOffVM_Task()
             if self.wait_for_task(task):
-                print(f"  VM {vm.name} powered off successfully")
+                common.log(f"  VM {vm_props.name} powered off successfully")
                 return True
             return False
         except Exception as e:
-            print(f"  Error powering off VM: {str(e)}")
+            common.log(f"  Error powering off VM: {str(e)}")
             return False
 
-    def power_on_vm(self, vm):
+    def power_on_vm(self, vm_props):
         """
         Power on a VM.
 
         Args:
-            vm: VM object
+            vm_props: VM properties from collect_vm_props()
 
         Returns:
             True if successful, False otherwise
         """
         try:
-            print(f"  Powering on VM: {vm.name}...")
-            task = vm.PowerOnVM_Task()
+            common.log(f"  Powering on VM: {vm_props.name}...")
+            task = vm_props.vm.PowerOnVM_Task()
             if self.wait_for_task(task):
-                print(f"  VM {vm.name} powered on successfully")
+                common.log(f"  VM {vm_props.name} powered on successfully")
                 return True
             return False
         except Exception as e:
-            print(f"  Error powering on VM: {str(e)}")
+            common.log(f"  Error powering on VM: {str(e)}")
             return False
 
-    def add_ptp_device(self, vm):
+    def build_device_changes(self, add=(), remove=(), extra_settings=None):
+        """
+        Build a single VM config spec covering several device changes.
+
+        Args:
+            add: Devices to add
+            remove: Devices to remove
+            extra_settings: Optional dictionary of additional ConfigSpec
+                properties to apply in the same reconfigure
+
+        Returns:
+            ConfigSpec object
+        """
+        device_changes = [
+            _VirtualDeviceSpec(operation=_AddOp, device=device) for device in add
+        ]
+        device_changes.extend(
+            _VirtualDeviceSpec(operation=_RemoveOp, device=device) for device in remove
+        )
+
+        return _ConfigSpec(deviceChange=device_changes, **(extra_settings or {}))
+
+    def add_ptp_device(self, vm_props, extra_settings=None):
         """
         Add PTP device to VM.
 
         Args:
-            vm: VM object
+            vm_props: VM properties from collect_vm_props()
+            extra_settings: Optional dictionary of additional ConfigSpec
+                properties to apply in the same reconfigure
 
         Returns:
             True if successful, False otherwise
         """
         try:
-            print(f"  Adding PTP device to VM: {vm.name}...")
+            common.log(f"  Adding PTP device to VM: {vm_props.name}...")
+            for setting, value in (extra_settings or {}).items():
+                common.log(f"    {setting}: {value}")
 
-            # Create PTP device specification
-            ptp_device = vim.vm.device.VirtualPrecisionClock()
-            ptp_device.key = -1  # Auto-assign key
-
-            # Create device backing info
-            backing = vim.vm.device.VirtualPrecisionClock.SystemClockBackingInfo()
-            ptp_device.backing = backing
-
-            # Create device change spec
-            device_spec = vim.vm.device.VirtualDeviceSpec()
-            device_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.add
-            device_spec.device = ptp_device
+            # Create PTP device specification with its backing info;
+            # key -1 lets vCenter auto-assign the key
+            ptp_device = _PTPClock(key=-1, backing=_PTPBacking())
 
             # Create VM config spec
-            config_spec = vim.vm.ConfigSpec()
-            config_spec.deviceChange = [device_spec]
+            config_spec = self.build_device_changes(add=[ptp_device], extra_settings=extra_settings)
 
             # Reconfigure VM
-            task = vm.ReconfigVM_Task(config_spec)
+            task = vm_props.vm.ReconfigVM_Task(config_spec)
 
             if self.wait_for_task(task):
-                print(f"  PTP device added successfully to {vm.name}")
+                common.log(f"  PTP device added successfully to {vm_props.name}")
                 return True
             else:
-                print(f"  Failed to add PTP device to {vm.name}")
+                common.log(f"  Failed to add PTP device to {vm_props.name}")
                 return False
 
         except Exception as e:
-            print(f"  Error adding PTP device: {str(e)}")
+            common.log(f"  Error adding PTP device: {str(e)}")
             return False
 
-    def has_ptp_device(self, vm):
+    def has_ptp_device(self, vm_props):
         """
         Check if VM already has a PTP device.
 
         Args:
-            vm: VM object
+            vm_props: VM properties from collect_vm_props()
 
         Returns:
             True if PTP device exists, False otherwise
         """
-        for device in vm.config.hardware.device:
-            if isinstance(device, vim.vm.device.VirtualPrecisionClock):
-                return True
-        return False
+        return self.get_ptp_device(vm_props) is not None
 
-    def get_ptp_device(self, vm):
+    def get_ptp_device(self, vm_props):
         """
         Get PTP device from VM if it exists.
 
+        The device list is scanned once per VM and the result is cached on
+        vm_props, as it is checked several times while processing a VM.
+
         Args:
-            vm: VM object
+            vm_props: VM properties from collect_vm_props()
 
         Returns:
             PTP device object or None if not found
         """
-        for device in vm.config.hardware.device:
-            if isinstance(device, vim.vm.device.VirtualPrecisionClock):
-                return device
-        return None
+        if not hasattr(vm_props, 'ptp_device'):
+            vm_props.ptp_device = next(
+                (device for device in vm_props.device or [] if isinstance(device, _PTPClock)),
+                None
+            )
+        return vm_props.ptp_device
+
+    def collect_ptp_status(self, vms):
+        """
+        Classify several VMs by PTP device presence and power state.
+
+        All properties are fetched with a single PropertyCollector query.
+
+        Args:
+            vms: Iterable of VM objects
 
-    def remove_ptp_device(self, vm):
+        Returns:
+            Dictionary with 'has_ptp', 'no_ptp' and 'powered_on' lists of VM
+            properties from collect_vm_props(); every VM is in exactly one of
+            'has_ptp' and 'no_ptp'
+        """
+        status = {
+            'has_ptp': [],
+            'no_ptp': [],
+            'powered_on': []
+        }
+
+        for vm_props in self.collect_vm_props(vms).values():
+            if self.has_ptp_device(vm_props):
+                status['has_ptp'].append(vm_props)
+            else:
+                status['no_ptp'].append(vm_props)
+            if vm_props.powerState == vim.VirtualMachinePowerState.poweredOn:
+                status['powered_on'].append(vm_props)
+
+        return status
+
+    def remove_ptp_device(self, vm_props, extra_settings=None):
         """
         Remove PTP device from VM.
 
         Args:
-            vm: VM object
+            vm_props: VM properties from collect_vm_props()
+            extra_settings: Optional dictionary of additional ConfigSpec
+                properties to apply in the same reconfigure
 
         Returns:
             True if successful, False otherwise
         """
         try:
-            print(f"  Removing PTP device from VM: {vm.name}...")
+            common.log(f"  Removing PTP device from VM: {vm_props.name}...")
+            for setting, value in (extra_settings or {}).items():
+                common.log(f"    {setting}: {value}")
 
             # Get the PTP device
-            ptp_device = self.get_ptp_device(vm)
+            ptp_device = self.get_ptp_device(vm_props)
             if not ptp_device:
-                print(f"  No PTP device found on {vm.name}")
+                common.log(f"  No PTP device found on {vm_props.name}")
                 return False
 
-            # Create device change spec for removal
-            device_spec = vim.vm.device.VirtualDeviceSpec()
-            device_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.remove
-            device_spec.device = ptp_device
-
             # Create VM config spec
-            config_spec = vim.vm.ConfigSpec()
-            config_spec.deviceChange = [device_spec]
+            config_spec = self.build_device_changes(remove=[ptp_device], extra_settings=extra_settings)
 
             # Reconfigure VM
-            task = vm.ReconfigVM_Task(config_spec)
+            task = vm_props.vm.ReconfigVM_Task(config_spec)
 
             if self.wait_for_task(task):
-                print(f"  PTP device removed successfully from {vm.name}")
+                common.log(f"  PTP device removed successfully from {vm_props.name}")
                 return True
             else:
-                print(f"  Failed to remove PTP device from {vm.name}")
+                common.log(f"  Failed to remove PTP device from {vm_props.name}")
                 return False
 
         except Exception as e:
-            print(f"  Error removing PTP device: {str(e)}")
+            common.log(f"  Error removing PTP device: {str(e)}")
             return False
 
-    def process_vm(self, vm_name, action='enable'):
+    def process_vm(self, vm_props, action='enable', extra_settings=None):
         """
         Process a single VM to manage PTP device.
 
         Args:
-            vm_name: Name of the VM
+            vm_props: VM properties from collect_vm_props()
             action: Action to perform ('read', 'enable', 'disable')
+            extra_settings: Optional dictionary of additional ConfigSpec
+                properties to apply in the same reconfigure as the PTP change
 
         Returns:
             True if successful, False if failed, None if skipped
         """
-        print(f"\nProcessing VM: {vm_name}")
-
-        # Find the VM
-        vm = self.get_vm_by_name(vm_name)
-        if not vm:
-            print(f"  ERROR: VM '{vm_name}' not found")
-            return False
+        vm_name = vm_props.name
+        common.log(f"\nProcessing VM: {vm_name}")
 
         # Handle read action
         if action == 'read':
-            has_ptp = self.has_ptp_device(vm)
-            print(f"  PTP Device Status: {'Present' if has_ptp else 'Not Present'}")
+            has_ptp = self.has_ptp_device(vm_props)
+            common.log(f"  PTP Device Status: {'Present' if has_ptp else 'Not Present'}")
             if has_ptp:
-                ptp_device = self.get_ptp_device(vm)
-                print(f"  PTP Device Key: {ptp_device.key}")
-                print(f"  PTP Device Label: {ptp_device.deviceInfo.label}")
+                ptp_device = self.get_ptp_device(vm_props)
+                common.log(f"  PTP Device Key: {ptp_device.key}")
+                common.log(f"  PTP Device Label: {ptp_device.deviceInfo.label}")
             return True
 
         # Handle enable action
         if action == 'enable':
             # Check if PTP device already exists
-            if self.has_ptp_device(vm):
-                print(f"  VM {vm_name} already has a PTP device. Skipping.")
+            if self.has_ptp_device(vm_props):
+                common.log(f"  VM {vm_name} already has a PTP device. Skipping.")
                 return None
 
             # Check power state
-            power_state = vm.runtime.powerState
-            print(f"  Current power state: {power_state}")
+            power_state = vm_props.powerState
+            common.log(f"  Current power state: {power_state}")
 
             was_powered_on = False
 
             # If VM is powered on, power it off
             if power_state == vim.VirtualMachinePowerState.poweredOn:
                 was_powered_on = True
-                if not self.power_off_vm(vm):
+                if not self.power_off_vm(vm_props):
                     return False
-                # Wait a bit for VM to fully power off
-                time.sleep(2)
 
             # Add PTP device
-            success = self.add_ptp_device(vm)
+            success = self.add_ptp_device(vm_props, extra_settings)
 
             # If VM was originally powered on, power it back on
             if was_powered_on and success:
-                time.sleep(2)  # Wait a bit before powering on
-                if not self.power_on_vm(vm):
-                    print(f"  WARNING: Failed to power on VM {vm_name}")
+                if not self.power_on_vm(vm_props):
+                    common.log(f"  WARNING: Failed to power on VM {vm_name}")
                     return False
 
             return success
@@ -335,32 +467,29 @@ class VCenterManager:
         # Handle disable action
         if action == 'disable':
             # Check if PTP device exists
-            if not self.has_ptp_device(vm):
-                print(f"  VM {vm_name} does not have a PTP device. Skipping.")
+            if not self.has_ptp_device(vm_props):
+                common.log(f"  VM {vm_name} does not have a PTP device. Skipping.")
                 return None
 
             # Check power state
-            power_state = vm.runtime.powerState
-            print(f"  Current power state: {power_state}")
+            power_state = vm_props.powerState
+            common.log(f"  Current power state: {power_state}")
 
             was_powered_on = False
 
             # If VM is powered on, power it off
             if power_state == vim.VirtualMachinePowerState.poweredOn:
                 was_powered_on = True
-                if not self.power_off_vm(vm):
+                if not self.power_off_vm(vm_props):
                     return False
-                # Wait a bit for VM to fully power off
-                time.sleep(2)
 
             # Remove PTP device
-            success = self.remove_ptp_device(vm)
+            success = self.remove_ptp_device(vm_props, extra_settings)
 
             # If VM was originally powered on, power it back on
             if was_powered_on and success:
-                time.sleep(2)  # Wait a bit before powering on
-                if not self.power_on_vm(vm):
-                    print(f"  WARNING: Failed to power on VM {vm_name}")
+                if not self.power_on_vm(vm_props):
+                    common.log(f"  WARNING: Failed to power on VM {vm_name}")
                     return False
 
             return success
@@ -387,33 +516,17 @@ Examples:
   # Use environment variable for password
   export VCENTER_PASSWORD="mypassword"
   %(prog)s -s vcenter.example.com -u admin@vsphere.local -v vm1,vm2 --enable
-        """
-    )
 
-    # Required arguments
-    parser.add_argument(
-        '-s', '--server',
-        required=True,
-        help='vCenter server hostname or IP address'
-    )
-
-    parser.add_argument(
-        '-u', '--user',
-        required=True,
-        help='vCenter username'
-    )
+  # Enable PTP device and VM operation notifications in a single reconfigure
+  %(prog)s -s vcenter.example.com -u admin@vsphere.local -v vm1,vm2 --enable --combine-with notification --notification-timeout 600
 
-    parser.add_argument(
-        '-w', '--password',
-        help='vCenter password (if not provided, will prompt or use VCENTER_PASSWORD env var)'
+  # Enable PTP device on at most 4 VMs at a time
+  %(prog)s -s vcenter.example.com -u admin@vsphere.local -v vm1,vm2,vm3 --enable --max-concurrency 4
+        """
     )
 
-    # VM selection arguments
-    parser.add_argument(
-        '-v', '--vms',
-        required=True,
-        help='Comma-separated list of VM names'
-    )
+    # Connection, VM selection and run arguments
+    common.add_common_arguments(parser)
 
     # Action arguments
     action_group = parser.add_mutually_exclusive_group(required=True)
@@ -435,32 +548,31 @@ Examples:
 
     # Optional arguments
     parser.add_argument(
-        '--port',
-        type=int,
-        default=443,
-        help='vCenter server port (default: 443)'
+        '--combine-with',
+        choices=['notification'],
+        help='Also apply VM operation notification settings in the same reconfigure '
+             'as the PTP change (--enable turns notifications on with '
+             '--notification-timeout, --disable turns them off)'
     )
 
     parser.add_argument(
-        '--no-ssl-verify',
-        action='store_true',
-        default=True,
-        help='Disable SSL certificate verification (default: enabled for compatibility)'
+        '--notification-timeout',
+        type=int,
+        help='VM operation notification timeout in seconds '
+             '(required with --combine-with notification --enable)'
     )
 
-    parser.add_argument(
-        '--no-confirm',
-        action='store_true',
-        help='Skip confirmation prompt before processing VMs'
-    )
+    args = parser.parse_args()
+    common.check_common_arguments(parser, args)
 
-    parser.add_argument(
-        '--dry-run',
-        action='store_true',
-        help='Show which VMs would be processed without making changes'
-    )
+    if args.combine_with and args.read:
+        parser.error('--combine-with cannot be used with --read')
 
-    args = parser.parse_args()
+    if args.notification_timeout is not None and args.combine_with != 'notification':
+        parser.error('--notification-timeout requires --combine-with notification')
+
+    if args.combine_with == 'notification' and args.enable and args.notification_timeout is None:
+        parser.error('--notification-timeout is required when using --combine-with notification --enable')
 
     return args
 
@@ -468,6 +580,7 @@ Examples:
 def main():
     """Main function."""
     args = parse_arguments()
+    run = common.BatchRun(args)
 
     # Determine action
     if args.read:
@@ -488,117 +601,70 @@ def main():
     print(f"Action: {action_desc}")
     print("=" * 60)
 
-    # Get password if not provided
-    if args.password:
-        vcenter_password = args.password
-    else:
-        import os
-        vcenter_password = os.environ.get('VCENTER_PASSWORD')
-        if not vcenter_password:
-            vcenter_password = getpass.getpass(f"Enter password for {args.user}: ")
-
-    # Connect to vCenter
-    print(f"\nConnecting to vCenter: {args.server}")
-    if args.no_ssl_verify:
-        print("  SSL certificate verification: DISABLED")
-    vcenter = VCenterManager(args.server, args.user, vcenter_password, args.port, args.no_ssl_verify)
-    if not vcenter.connect():
-        print("Failed to connect to vCenter. Exiting.")
-        sys.exit(1)
-
-    # Parse VM names from comma-separated list
-    vm_names = [name.strip() for name in args.vms.split(',')]
-
-    # Find all VMs
-    print(f"\nLooking up VMs: {', '.join(vm_names)}")
-    vms_to_process = []
-
-    for vm_name in vm_names:
-        vm = vcenter.get_vm_by_name(vm_name)
-        if vm:
-            vms_to_process.append(vm)
-            print(f"  Found: {vm_name}")
-        else:
-            print(f"  WARNING: VM '{vm_name}' not found")
-
-    # Check if we have VMs to process
-    if not vms_to_process:
-        print("\nNo VMs to process. Exiting.")
-        sys.exit(0)
-
-    print(f"\n{'=' * 60}")
-    print(f"Total VMs to process: {len(vms_to_process)}")
-    for vm in vms_to_process:
-        print(f"  - {vm.name}")
-
-    # Dry run mode
-    if args.dry_run:
-        print(f"\n{'=' * 60}")
-        print("DRY RUN MODE - No changes will be made")
-        print(f"{'=' * 60}")
-        print("\nScript completed (dry run).")
-        sys.exit(0)
-
-    # Confirmation prompt (skip for read operations)
-    if not args.no_confirm and not args.read:
-        print(f"\n{'=' * 60}")
-        confirm = input("Continue with processing? (yes/no): ").strip().lower()
-        if confirm not in ['yes', 'y']:
-            print("Operation cancelled.")
-            sys.exit(0)
-
-    # Process each VM
-    print("\n" + "=" * 60)
-    print("Processing VMs...")
-    print("=" * 60)
+    try:
+        # Connect to vCenter
+        print(f"\nConnecting to vCenter: {args.server}")
+        if args.no_ssl_verify:
+            print("  SSL certificate verification: DISABLED")
+        vcenter = VCenterManager(
+            args.server, args.user, args.password, args.port, args.no_ssl_verify,
+            use_agent=not args.no_agent, pool_size=args.max_concurrency
+        )
+        if not vcenter.connect():
+            print("Failed to connect to vCenter. Exiting.")
+            run.exit(1)
 
-    results = {
-        'success': [],
-        'failed': [],
-        'skipped': []
-    }
-
-    for vm in vms_to_process:
-        result = vcenter.process_vm(vm.name, action=action)
-        if result is True:
-            results['success'].append(vm.name)
-        elif result is None:  # Skipped
-            results['skipped'].append(vm.name)
-        else:
-            results['failed'].append(vm.name)
+        # Find all VMs and classify them, so that the confirmation prompt and
+        # --dry-run show what will actually happen
+        vms_to_process = run.find_vms(vcenter.get_vms_by_names)
 
-    # Print summary
-    print("\n" + "=" * 60)
-    print("SUMMARY")
-    print("=" * 60)
-    print(f"Total VMs processed: {len(vms_to_process)}")
-    print(f"Successful: {len(results['success'])}")
-    print(f"Skipped: {len(results['skipped'])}")
-    print(f"Failed: {len(results['failed'])}")
+        ptp_status = vcenter.collect_ptp_status([vm for _, vm in vms_to_process])
+        vm_props = {props.vm: props for props in ptp_status['has_ptp'] + ptp_status['no_ptp']}
 
-    if results['success']:
-        print("\nSuccessful VMs:")
-        for vm in results['success']:
-            print(f"  ✓ {vm}")
-
-    if results['skipped']:
+        # VMs already in the requested state need no further calls
         skip_reason = "already have PTP" if action == 'enable' else "don't have PTP"
-        print(f"\nSkipped VMs ({skip_reason}):")
-        for vm in results['skipped']:
-            print(f"  ⊘ {vm}")
+        if action == 'enable':
+            skip_vms = {props.vm for props in ptp_status['has_ptp']}
+            skip_message = "already has a PTP device"
+        elif action == 'disable':
+            skip_vms = {props.vm for props in ptp_status['no_ptp']}
+            skip_message = "does not have a PTP device"
+        else:
+            skip_vms = set()
+
+        if action != 'read':
+            power_cycled = [props for props in ptp_status['powered_on'] if props.vm not in skip_vms]
+            print(f"\nVMs to change: {len(vm_props) - len(skip_vms)} "
+                  f"({len(power_cycled)} powered on, will be power-cycled)")
+            print(f"VMs to skip: {len(skip_vms)} ({skip_reason})")
+
+        run.confirm(vms_to_process)
+
+        # Settings from other tools applied in the same reconfigure as the PTP change
+        extra_settings = {}
+        if args.combine_with == 'notification':
+            extra_settings['vmOpNotificationToAppEnabled'] = action == 'enable'
+            if args.notification_timeout is not None:
+                extra_settings['vmOpNotificationTimeout'] = args.notification_timeout
+
+        vms_to_change = []
+        for vm_name, vm in vms_to_process:
+            if vm in skip_vms:
+                run.skip(vm_name, skip_message)
+            else:
+                vms_to_change.append((vm_name, vm_props.get(vm)))
 
-    if results['failed']:
-        print("\nFailed VMs:")
-        for vm in results['failed']:
-            print(f"  ✗ {vm}")
+        # Process VMs in parallel; each worker waits on its own tasks
+        run.process(
+            vms_to_change,
+            lambda props: vcenter.process_vm(props, action, extra_settings)
+        )
 
-    print("\nScript completed.")
+        run.finish(skip_reason=skip_reason)
 
-    # Exit with appropriate code
-    if results['failed']:
-        sys.exit(1)
-    else:
-        sys.exit(0)
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        run.exit(1)
 
 
 if __name__ == "__main__":
@@ -11,62 +11,88 @@ Reference: https://developer.broadcom.com/xapis/vsphere-web-services-api/8.0u3/v
 
 import argparse
 import sys
-import ssl
-import getpass
-import atexit
-from pyVim import connect
-from pyVmomi import vim
+import _vcenter_common as common
 
+# ConfigSpec type, resolved once by import_vsphere_modules() instead of
+# through the vim namespace for every VM
+_ConfigSpec = None
 
-def get_vm_by_name(content, vm_name):
+# VM properties needed to process a VM, fetched up front in one query
+VM_PROPERTY_PATHS = [
+    'name',
+    'config.vmOpNotificationToAppEnabled',
+    'config.vmOpNotificationTimeout'
+]
+
+
+def import_vsphere_modules():
+    """
+    Import pyVmomi on first use and resolve the ConfigSpec type.
+    """
+    global _ConfigSpec
+    
+    if _ConfigSpec is not None:
+        return
+    
+    common.import_vsphere_modules()
+    _ConfigSpec = common.vim.vm.ConfigSpec
+
+
+def collect_vm_props(content, vms, path_set=VM_PROPERTY_PATHS):
     """
-    Find a VM by name.
+    Fetch the properties needed to process several VMs with a single query.
     
     Args:
         content: ServiceInstance content
-        vm_name: Name of the VM to find
+        vms: Iterable of VirtualMachine objects
+        path_set: Property paths to retrieve
         
     Returns:
-        VirtualMachine object or None
+        Dictionary mapping each VirtualMachine object to its properties
+        (see _vcenter_common.collect_vm_props())
     """
-    container = content.viewManager.CreateContainerView(
-        content.rootFolder, [vim.VirtualMachine], True
-    )
-    
-    for vm in container.view:
-        if vm.name == vm_name:
-            container.Destroy()
-            return vm
-    
-    container.Destroy()
-    return None
+    return common.collect_vm_props(content, vms, path_set)
 
 
-def get_vm_notification_settings(vm):
+def get_vm_notification_settings(vm_props):
     """
     Get current VM notification settings.
     
     Args:
-        vm: VirtualMachine object
+        vm_props: VM properties from collect_vm_props()
         
     Returns:
         Dictionary with current settings
     """
-    config = vm.config
-    
     settings = {
-        'vmOpNotificationToAppEnabled': getattr(config, 'vmOpNotificationToAppEnabled', None),
-        'vmOpNotificationTimeout': getattr(config, 'vmOpNotificationTimeout', None)
+        'vmOpNotificationToAppEnabled': vm_props.vmOpNotificationToAppEnabled,
+        'vmOpNotificationTimeout': vm_props.vmOpNotificationTimeout
     }
     
     return settings
 
 
-def set_vm_notification_settings(vm, timeout=None, enabled=None):
+def wait_for_task(content, task, timeout=300):
+    """
+    Wait for a vCenter task to complete (see _vcenter_common.wait_for_task()).
+    
+    Args:
+        content: ServiceInstance content
+        task: Task object
+        timeout: Maximum wait time in seconds
+        
+    Returns:
+        True if successful, False otherwise
+    """
+    return common.wait_for_task(content, task, timeout)
+
+
+def set_vm_notification_settings(content, vm, timeout=None, enabled=None):
     """
     Set VM notification settings.
     
     Args:
+        content: ServiceInstance content
         vm: VirtualMachine object
         timeout: vmOpNotificationTimeout value (in seconds)
         enabled: vmOpNotificationToAppEnabled value (boolean)
@@ -74,53 +100,38 @@ def set_vm_notification_settings(vm, timeout=None, enabled=None):
     Returns:
         True if successful, False otherwise
     """
-    spec = vim.vm.ConfigSpec()
-    
-    if enabled is not None:
-        spec.vmOpNotificationToAppEnabled = enabled
-    
-    if timeout is not None:
-        spec.vmOpNotificationTimeout = timeout
+    spec = _ConfigSpec(vmOpNotificationToAppEnabled=enabled, vmOpNotificationTimeout=timeout)
     
     try:
         task = vm.ReconfigVM_Task(spec)
+        return wait_for_task(content, task)
         
-        # Wait for the task to complete
-        while task.info.state not in [vim.TaskInfo.State.success, vim.TaskInfo.State.error]:
-            pass
-        
-        if task.info.state == vim.TaskInfo.State.success:
-            return True
-        else:
-            print(f"Error: Task failed with error: {task.info.error.msg}", file=sys.stderr)
-            return False
-            
     except Exception as e:
-        print(f"Error: Failed to reconfigure VM: {str(e)}", file=sys.stderr)
+        common.log(f"Error: Failed to reconfigure VM: {str(e)}", file=sys.stderr)
         return False
 
 
-def process_vm(vm, args, content):
+def process_vm(vm_props, args, content):
     """
     Process a single VM for notification settings.
     
     Args:
-        vm: VirtualMachine object
+        vm_props: VM properties from collect_vm_props()
         args: Command line arguments
         content: ServiceInstance content
         
     Returns:
         True if successful, False otherwise
     """
-    print(f"\nProcessing VM: {vm.name}")
+    common.log(f"\nProcessing VM: {vm_props.name}")
     
     # Perform the requested action
     if args.read:
         # Read current settings
-        settings = get_vm_notification_settings(vm)
-        print("  Current VM Notification Settings:")
-        print(f"    vmOpNotificationToAppEnabled: {settings['vmOpNotificationToAppEnabled']}")
-        print(f"    vmOpNotificationTimeout: {settings['vmOpNotificationTimeout']}")
+        settings = get_vm_notification_settings(vm_props)
+        common.log("  Current VM Notification Settings:")
+        common.log(f"    vmOpNotificationToAppEnabled: {settings['vmOpNotificationToAppEnabled']}")
+        common.log(f"    vmOpNotificationTimeout: {settings['vmOpNotificationTimeout']}")
         return True
         
     else:
@@ -128,24 +139,27 @@ def process_vm(vm, args, content):
         enabled = True if args.enable else False if args.disable else None
         timeout = args.timeout
         
-        print("  Configuring VM notification settings...")
-        print(f"    vmOpNotificationToAppEnabled: {enabled}")
+        common.log("  Configuring VM notification settings...")
+        common.log(f"    vmOpNotificationToAppEnabled: {enabled}")
         if timeout is not None:
-            print(f"    vmOpNotificationTimeout: {timeout}")
+            common.log(f"    vmOpNotificationTimeout: {timeout}")
         
-        success = set_vm_notification_settings(vm, timeout=timeout, enabled=enabled)
+        success = set_vm_notification_settings(
+            content, vm_props.vm, timeout=timeout, enabled=enabled
+        )
         
         if success:
-            print("  ✓ VM notification settings updated successfully")
+            common.log("  ✓ VM notification settings updated successfully")
             
-            # Read and display new settings
-            settings = get_vm_notification_settings(vm)
-            print("  New VM Notification Settings:")
-            print(f"    vmOpNotificationToAppEnabled: {settings['vmOpNotificationToAppEnabled']}")
-            print(f"    vmOpNotificationTimeout: {settings['vmOpNotificationTimeout']}")
+            # Re-read and display new settings
+            new_props = collect_vm_props(content, [vm_props.vm]).get(vm_props.vm, vm_props)
+            settings = get_vm_notification_settings(new_props)
+            common.log("  New VM Notification Settings:")
+            common.log(f"    vmOpNotificationToAppEnabled: {settings['vmOpNotificationToAppEnabled']}")
+            common.log(f"    vmOpNotificationTimeout: {settings['vmOpNotificationTimeout']}")
             return True
         else:
-            print("  ✗ Failed to update VM notification settings", file=sys.stderr)
+            common.log("  ✗ Failed to update VM notification settings", file=sys.stderr)
             return False
 
 
@@ -167,19 +181,8 @@ Examples:
         """
     )
     
-    # vCenter connection arguments
-    parser.add_argument('-s', '--server', required=True,
-                        help='vCenter server hostname or IP address')
-    parser.add_argument('-u', '--user', required=True,
-                        help='vCenter username')
-    parser.add_argument('-w', '--password',
-                        help='vCenter password (will prompt if not provided)')
-    parser.add_argument('--port', type=int, default=443,
-                        help='vCenter port (default: 443)')
-    
-    # VM identification arguments
-    parser.add_argument('-v', '--vms', required=True,
-                        help='Comma-separated list of VM names')
+    # Connection, VM selection and run arguments
+    common.add_common_arguments(parser)
     
     # Action arguments
     action_group = parser.add_mutually_exclusive_group(required=True)
@@ -194,144 +197,69 @@ Examples:
     parser.add_argument('--timeout', type=int,
                         help='VM operation notification timeout in seconds')
     
-    # Optional arguments
-    parser.add_argument('--no-ssl-verify', action='store_true', default=True,
-                        help='Disable SSL certificate verification (default: enabled for compatibility)')
-    parser.add_argument('--no-confirm', action='store_true',
-                        help='Skip confirmation prompt before processing VMs')
-    parser.add_argument('--dry-run', action='store_true',
-                        help='Show which VMs would be processed without making changes')
-    
     args = parser.parse_args()
     
     # Validate arguments
+    common.check_common_arguments(parser, args)
     if args.enable and args.timeout is None:
         parser.error('--timeout is required when using --enable')
     
-    # Get password if not provided
-    password = args.password
-    if not password:
-        import os
-        password = os.environ.get('VCENTER_PASSWORD')
-        if not password:
-            password = getpass.getpass(f'Enter password for {args.user}: ')
-    
-    # Create SSL context based on no_ssl_verify setting
-    if args.no_ssl_verify:
-        ssl_context = ssl._create_unverified_context()
-    else:
-        ssl_context = ssl.create_default_context()
+    run = common.BatchRun(args)
     
     print("=" * 60)
     print("vCenter VM Notification Configuration Script")
     print("=" * 60)
     
     try:
+        import_vsphere_modules()
+        
         # Connect to vCenter
         print(f"\nConnecting to vCenter: {args.server}...")
         if args.no_ssl_verify:
             print("  SSL certificate verification: DISABLED")
-        si = connect.SmartConnect(
-            host=args.server,
-            user=args.user,
-            pwd=password,
-            port=args.port,
-            sslContext=ssl_context
-        )
         
-        # Register disconnect on exit
-        atexit.register(connect.Disconnect, si)
-        print("Successfully connected to vCenter")
+        # The password is only asked for if there is no agent session
+        si, password = common.connect(
+            args.server, args.user, args.password, args.port, args.no_ssl_verify,
+            use_agent=not args.no_agent, pool_size=args.max_concurrency
+        )
+        if password is None:
+            print("Reusing vCenter session from local agent")
+        else:
+            print("Successfully connected to vCenter")
         
         content = si.RetrieveContent()
         
-        # Parse VM names from comma-separated list
-        vm_names = [name.strip() for name in args.vms.split(',')]
-        
-        # Find all VMs
-        print(f"\nLooking up VMs: {', '.join(vm_names)}")
-        vms_to_process = []
-        
-        for vm_name in vm_names:
-            vm = get_vm_by_name(content, vm_name)
-            if vm:
-                vms_to_process.append(vm)
-                print(f"  Found: {vm_name}")
-            else:
-                print(f"  WARNING: VM '{vm_name}' not found")
-        
-        # Check if we have VMs to process
-        if not vms_to_process:
-            print("\nNo VMs to process. Exiting.")
-            sys.exit(0)
-        
-        print(f"\n{'=' * 60}")
-        print(f"Total VMs to process: {len(vms_to_process)}")
-        for vm in vms_to_process:
-            print(f"  - {vm.name}")
-        
-        # Dry run mode
-        if args.dry_run:
-            print(f"\n{'=' * 60}")
-            print("DRY RUN MODE - No changes will be made")
-            print(f"{'=' * 60}")
-            print("\nScript completed (dry run).")
-            sys.exit(0)
-        
-        # Confirmation prompt
-        if not args.no_confirm and not args.read:
-            print(f"\n{'=' * 60}")
-            confirm = input("Continue with processing? (yes/no): ").strip().lower()
-            if confirm not in ['yes', 'y']:
-                print("Operation cancelled.")
-                sys.exit(0)
+        # One VM view reused for every lookup during the run
+        vm_view = common.create_vm_view(content)
         
-        # Process each VM
-        print("\n" + "=" * 60)
-        print("Processing VMs...")
-        print("=" * 60)
+        # Use the REST API for VM lookups when available; skipped for
+        # agent sessions, as it would need a login of its own
+        rest_client = None
+        if password is not None:
+            rest_client = common.create_rest_client(
+                args.server, args.user, password, args.port, args.no_ssl_verify
+            )
         
-        results = {
-            'success': [],
-            'failed': []
-        }
-        
-        for vm in vms_to_process:
-            success = process_vm(vm, args, content)
-            if success:
-                results['success'].append(vm.name)
-            else:
-                results['failed'].append(vm.name)
-        
-        # Print summary
-        print("\n" + "=" * 60)
-        print("SUMMARY")
-        print("=" * 60)
-        print(f"Total VMs processed: {len(vms_to_process)}")
-        print(f"Successful: {len(results['success'])}")
-        print(f"Failed: {len(results['failed'])}")
-        
-        if results['success']:
-            print("\nSuccessful VMs:")
-            for vm in results['success']:
-                print(f"  ✓ {vm}")
+        # Find all VMs and confirm before changing them
+        vms_to_process = run.find_vms(
+            lambda vm_names: common.get_vms_by_names(content, vm_view, vm_names, rest_client)
+        )
+        run.confirm(vms_to_process)
         
-        if results['failed']:
-            print("\nFailed VMs:")
-            for vm in results['failed']:
-                print(f"  ✗ {vm}")
+        vm_props = collect_vm_props(content, [vm for _, vm in vms_to_process])
         
-        print("\nScript completed.")
+        # Process VMs in parallel; each worker waits on its own tasks
+        run.process(
+            [(vm_name, vm_props.get(vm)) for vm_name, vm in vms_to_process],
+            lambda props: process_vm(props, args, content)
+        )
         
-        # Exit with appropriate code
-        if results['failed']:
-            sys.exit(1)
-        else:
-            sys.exit(0)
+        run.finish()
         
     except Exception as e:
         print(f"Error: {str(e)}", file=sys.stderr)
-        sys.exit(1)
+        run.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,484 @@
+#!/usr/bin/env python3
+"""
+Local agent that keeps one vCenter session open for repeated tool runs.
+
+The agent logs in once and serves a small JSON-RPC protocol on a Unix socket.
+add_ptp_to_vm.py and add_vmotion_notification_to_vm.py ask it for its session
+before connecting, and reuse that session instead of logging in again. The
+agent also exposes the individual VM operations for use from shell scripts.
+"""
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+# Interval between keepalive calls that stop vCenter expiring the session
+KEEPALIVE_INTERVAL = 600
+
+
+class AgentError(Exception):
+    """Error returned by the agent for an RPC call."""
+
+
+def default_socket_path():
+    """
+    Get the default agent socket path.
+
+    Returns:
+        Path of the socket in the user's runtime directory
+    """
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if not runtime_dir:
+        runtime_dir = f"/run/user/{os.getuid()}"
+    return os.path.join(runtime_dir, 'vcenter-agent.sock')
+
+
+def call_agent(method, params=None, socket_path=None, timeout=None):
+    """
+    Call an agent method.
+
+    Args:
+        method: Name of the RPC method
+        params: Dictionary of method parameters
+        socket_path: Agent socket path (default: default_socket_path())
+        timeout: Socket timeout in seconds (default: no timeout)
+
+    Returns:
+        Result of the method
+
+    Raises:
+        OSError: If the agent cannot be reached
+        AgentError: If the method fails
+    """
+    request = {'method': method, 'params': params or {}}
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path or default_socket_path())
+        sock.sendall(json.dumps(request).encode() + b'\n')
+        with sock.makefile('rb') as reader:
+            line = reader.readline()
+
+    if not line:
+        raise AgentError('Agent closed the connection without a response')
+
+    response = json.loads(line)
+    if 'error' in response:
+        raise AgentError(response['error'])
+    return response.get('result')
+
+
+def agent_running(socket_path=None):
+    """
+    Check whether an agent is listening on a socket.
+
+    Args:
+        socket_path: Agent socket path (default: default_socket_path())
+
+    Returns:
+        True if the socket accepts connections, False otherwise
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(5)
+            sock.connect(socket_path or default_socket_path())
+        return True
+    except OSError:
+        return False
+
+
+def connect_via_agent(host, user, port=443, ssl_context=None, socket_path=None):
+    """
+    Attach to the vCenter session held by a running agent.
+
+    Args:
+        host: vCenter hostname or IP
+        user: vCenter username
+        port: vCenter port (default 443)
+        ssl_context: SSL context for the new connection
+        socket_path: Agent socket path (default: default_socket_path())
+
+    Returns:
+        ServiceInstance object, or None if no usable agent session exists.
+        The session belongs to the agent and must not be disconnected.
+    """
+    try:
+        session = call_agent(
+            'get_session',
+            {'host': host, 'user': user, 'port': port},
+            socket_path=socket_path,
+            timeout=5
+        )
+    except Exception:
+        # Any failure to reach an agent, including platforms without Unix
+        # sockets or os.getuid(), just means there is no session to reuse
+        return None
+
+    from pyVmomi import SoapStubAdapter, vim
+
+    stub = SoapStubAdapter(
+        host=host,
+        port=port,
+        version=session['version'],
+        sslContext=ssl_context,
+        sessionId=session['session_id']
+    )
+    si = vim.ServiceInstance('ServiceInstance', stub)
+
+    # Make sure the session is still valid before using it
+    try:
+        si.CurrentTime()
+    except Exception:
+        return None
+
+    return si
+
+
+class AgentRequestHandler(socketserver.StreamRequestHandler):
+    """Handles one JSON-RPC request per connection."""
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            request = json.loads(line)
+            method = request.get('method')
+            handler = self.server.agent.methods.get(method)
+            if handler is None:
+                response = {'error': f"Unknown method: {method}"}
+            else:
+                with self.server.agent.session():
+                    response = {'result': handler(**request.get('params', {}))}
+        except Exception as e:
+            response = {'error': str(e)}
+
+        self.wfile.write(json.dumps(response).encode() + b'\n')
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded Unix socket server bound to an Agent."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, agent):
+        self.agent = agent
+        super().__init__(socket_path, AgentRequestHandler)
+
+
+class Agent:
+    """Holds the vCenter session and implements the RPC methods."""
+
+    def __init__(self, host, user, password, port=443, no_ssl_verify=True):
+        """
+        Initialize the agent.
+
+        Args:
+            host: vCenter hostname or IP
+            user: vCenter username
+            password: vCenter password
+            port: vCenter port (default 443)
+            no_ssl_verify: Disable SSL certificate verification (default True)
+        """
+        # The tool modules are imported here so that clients only calling
+        # call_agent() or connect_via_agent() do not load them
+        import add_ptp_to_vm
+        import add_vmotion_notification_to_vm
+
+        self.notification = add_vmotion_notification_to_vm
+        self.notification.import_vsphere_modules()
+
+        # No REST session: keepalive() only keeps the SOAP session alive, so
+        # a REST session would expire between lookups
+        self.vcenter = add_ptp_to_vm.VCenterManager(
+            host, user, password, port, no_ssl_verify, use_agent=False, use_rest=False
+        )
+
+        # Number of RPC calls using the session; reconnects wait for zero
+        self._session_users = 0
+        self._session_condition = threading.Condition()
+        self.methods = {
+            'get_session': self.get_session,
+            'get_vm': self.get_vm,
+            'reconfig_add_ptp': self.reconfig_add_ptp,
+            'reconfig_remove_ptp': self.reconfig_remove_ptp,
+            'power_on': self.power_on,
+            'power_off': self.power_off,
+            'get_notification_settings': self.get_notification_settings,
+            'set_notification_settings': self.set_notification_settings,
+        }
+
+    def connect(self):
+        """
+        Connect to vCenter.
+
+        Returns:
+            True if successful, False otherwise
+        """
+        return self.vcenter.connect()
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Use the vCenter session for the duration of the block.
+
+        A reconnect waits until no block uses the session, and blocks
+        starting during a reconnect wait until it is done.
+        """
+        with self._session_condition:
+            self._session_users += 1
+        try:
+            yield self.vcenter
+        finally:
+            with self._session_condition:
+                self._session_users -= 1
+                self._session_condition.notify_all()
+
+    def keepalive(self, stop_event):
+        """
+        Keep the vCenter session alive, reconnecting if it has expired.
+
+        A reconnect waits for RPC calls in progress (see session()) and
+        releases the expired session's VM view before logging in again
+        (see VCenterManager.connect()).
+
+        Args:
+            stop_event: Event that ends the loop when set
+        """
+        while not stop_event.wait(KEEPALIVE_INTERVAL):
+            try:
+                self.vcenter.si.CurrentTime()
+            except Exception as e:
+                print(f"Session check failed ({str(e)}), reconnecting...")
+                with self._session_condition:
+                    self._session_condition.wait_for(lambda: self._session_users == 0)
+                    self.vcenter.connect()
+
+    def _find_vm(self, name):
+        """
+        Find a VM by name, raising if it does not exist.
+
+        Args:
+            name: Name or inventory path of the VM
+
+        Returns:
+            VM object
+        """
+        vm = self.vcenter.get_vm_by_name(name)
+        if not vm:
+            raise ValueError(f"VM '{name}' not found")
+        return vm
+
+    def _ptp_props(self, name):
+        """
+        Collect the PTP tool's VM properties for a VM.
+
+        Args:
+            name: Name or inventory path of the VM
+
+        Returns:
+            VM properties from VCenterManager.collect_vm_props()
+        """
+        vm = self._find_vm(name)
+        return self.vcenter.collect_vm_props([vm])[vm]
+
+    def get_session(self, host, user, port=443):
+        """
+        Get the session for callers targeting the same vCenter and user.
+
+        Args:
+            host: vCenter hostname or IP requested by the caller
+            user: vCenter username requested by the caller
+            port: vCenter port requested by the caller
+
+        Returns:
+            Dictionary with the session ID and negotiated API version
+        """
+        vcenter = self.vcenter
+        if (host, user, port) != (vcenter.host, vcenter.user, vcenter.port):
+            raise ValueError(
+                f"Agent is connected to {vcenter.host}:{vcenter.port} as {vcenter.user}"
+            )
+
+        stub = vcenter.si._stub
+        return {'session_id': stub.GetSessionId(), 'version': stub.version}
+
+    def get_vm(self, name):
+        """
+        Look up a VM.
+
+        Args:
+            name: Name or inventory path of the VM
+
+        Returns:
+            Dictionary with the VM name and managed object ID, or None
+        """
+        vm = self.vcenter.get_vm_by_name(name)
+        return {'name': name, 'vm': vm._moId} if vm else None
+
+    def reconfig_add_ptp(self, name):
+        """Add a PTP device to a powered-off VM."""
+        return self.vcenter.add_ptp_device(self._ptp_props(name))
+
+    def reconfig_remove_ptp(self, name):
+        """Remove the PTP device from a powered-off VM."""
+        return self.vcenter.remove_ptp_device(self._ptp_props(name))
+
+    def power_on(self, name):
+        """Power on a VM."""
+        return self.vcenter.power_on_vm(self._ptp_props(name))
+
+    def power_off(self, name):
+        """Power off a VM."""
+        return self.vcenter.power_off_vm(self._ptp_props(name))
+
+    def get_notification_settings(self, name):
+        """Get the VM operation notification settings of a VM."""
+        vm = self._find_vm(name)
+        vm_props = self.notification.collect_vm_props(self.vcenter.content, [vm])[vm]
+        return self.notification.get_vm_notification_settings(vm_props)
+
+    def set_notification_settings(self, name, timeout=None, enabled=None):
+        """Set the VM operation notification settings of a VM."""
+        vm = self._find_vm(name)
+        return self.notification.set_vm_notification_settings(
+            self.vcenter.content, vm, timeout=timeout, enabled=enabled
+        )
+
+
+def serve(args):
+    """
+    Run the agent until interrupted.
+
+    Args:
+        args: Parsed command line arguments
+    """
+    from _vcenter_common import get_password
+
+    # Only replace a stale socket; taking over the socket of a running agent
+    # would leave its session open with no way to reach it
+    socket_path = args.socket
+    if os.path.exists(socket_path):
+        if agent_running(socket_path):
+            print(f"Error: An agent is already listening on {socket_path}", file=sys.stderr)
+            sys.exit(1)
+        os.unlink(socket_path)
+
+    password = get_password(args.user, args.password)
+
+    agent = Agent(args.server, args.user, password, args.port, args.no_ssl_verify)
+    if not agent.connect():
+        print("Failed to connect to vCenter. Exiting.")
+        sys.exit(1)
+
+    old_umask = os.umask(0o177)
+    try:
+        server = AgentServer(socket_path, agent)
+    finally:
+        os.umask(old_umask)
+    atexit.register(os.unlink, socket_path)
+
+    stop_event = threading.Event()
+    threading.Thread(target=agent.keepalive, args=(stop_event,), daemon=True).start()
+
+    print(f"Agent listening on {socket_path}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping agent.")
+    finally:
+        stop_event.set()
+        server.server_close()
+
+
+def call(args):
+    """
+    Call an agent method and print its JSON result.
+
+    Args:
+        args: Parsed command line arguments
+    """
+    params = {}
+    for param in args.params:
+        key, _, value = param.partition('=')
+        # VM names stay strings, even if they look like numbers or booleans
+        if key == 'name':
+            params[key] = value
+            continue
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+
+    try:
+        result = call_agent(args.method, params, socket_path=args.socket)
+    except (OSError, AgentError) as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+
+    print(json.dumps(result, indent=2))
+
+
+def parse_arguments():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description='Keep a vCenter session open for the VM configuration tools',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Start the agent
+  %(prog)s serve -s vcenter.example.com -u admin@vsphere.local
+
+  # The tools now reuse the agent's session
+  ./add_ptp_to_vm.py -s vcenter.example.com -u admin@vsphere.local -v vm1 --read
+
+  # Call an agent method directly
+  %(prog)s call get_notification_settings name=vm1
+  %(prog)s call set_notification_settings name=vm1 enabled=true timeout=600
+        """
+    )
+    parser.add_argument(
+        '--socket',
+        default=default_socket_path(),
+        help='Agent socket path (default: %(default)s)'
+    )
+
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help='Connect to vCenter and serve requests')
+    serve_parser.add_argument('-s', '--server', required=True,
+                              help='vCenter server hostname or IP address')
+    serve_parser.add_argument('-u', '--user', required=True,
+                              help='vCenter username')
+    serve_parser.add_argument('-w', '--password',
+                              help='vCenter password (if not provided, will prompt or use VCENTER_PASSWORD env var)')
+    serve_parser.add_argument('--port', type=int, default=443,
+                              help='vCenter server port (default: 443)')
+    serve_parser.add_argument('--no-ssl-verify', action='store_true', default=True,
+                              help='Disable SSL certificate verification (default: enabled for compatibility)')
+    serve_parser.set_defaults(func=serve)
+
+    call_parser = subparsers.add_parser('call', help='Call an agent method')
+    call_parser.add_argument('method', help='Method name (e.g. get_vm, power_on)')
+    call_parser.add_argument('params', nargs='*', metavar='KEY=VALUE',
+                             help='Method parameters; values are parsed as JSON when possible')
+    call_parser.set_defaults(func=call)
+
+    return parser.parse_args()
+
+
+def main():
+    """Main function."""
+    args = parse_arguments()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
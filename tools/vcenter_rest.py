@@ -0,0 +1,90 @@
+"""
+Minimal vCenter REST API client used for read-only VM lookups.
+
+The REST API returns compact JSON and filters VMs by name server-side, which
+makes it cheaper than SOAP for resolving VM names. Reconfiguration still goes
+through pyVmomi, as the REST API does not expose the settings these tools
+change.
+"""
+
+import requests
+import urllib3
+
+# Seconds to wait for vCenter to accept and answer each request; a stuck
+# /api endpoint then fails the request, and lookups fall back to SOAP
+REQUEST_TIMEOUT = 10
+
+
+class VCenterRestClient:
+    """Manages a vCenter REST API session."""
+
+    def __init__(self, host, user, password, port=443, no_ssl_verify=True):
+        """
+        Initialize vCenter REST client.
+
+        Args:
+            host: vCenter hostname or IP
+            user: vCenter username
+            password: vCenter password
+            port: vCenter port (default 443)
+            no_ssl_verify: Disable SSL certificate verification (default True)
+        """
+        self.base_url = f"https://{host}:{port}/api"
+        self.user = user
+        self.password = password
+
+        # One keep-alive session reused for every request
+        self.session = requests.Session()
+        self.session.verify = not no_ssl_verify
+        if no_ssl_verify:
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    def login(self):
+        """
+        Create an API session and use its token for subsequent requests.
+
+        Raises:
+            requests.RequestException: If the login fails
+        """
+        response = self.session.post(
+            f"{self.base_url}/session",
+            auth=(self.user, self.password),
+            timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+        self.session.headers['vmware-api-session-id'] = response.json()
+
+    def logout(self):
+        """Delete the API session, ignoring errors."""
+        try:
+            self.session.delete(f"{self.base_url}/session", timeout=REQUEST_TIMEOUT)
+        except requests.RequestException:
+            pass
+        finally:
+            self.session.close()
+
+    def list_vms(self, vm_names):
+        """
+        Find VMs by name.
+
+        Args:
+            vm_names: Iterable of VM names
+
+        Returns:
+            Dictionary mapping each found VM name to its managed object ID
+
+        Raises:
+            requests.RequestException: If the request fails
+        """
+        response = self.session.get(
+            f"{self.base_url}/vcenter/vm",
+            params={'names': list(vm_names)},
+            timeout=REQUEST_TIMEOUT
+        )
+        response.raise_for_status()
+
+        vm_ids = {}
+        for summary in response.json():
+            vm_ids.setdefault(summary['name'], summary['vm'])
+
+        return vm_ids